@@ -1,9 +1,30 @@
 import pandas as pd
 import numpy as np
+from scipy.linalg import cho_factor, cho_solve
 from scipy.optimize import minimize
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import StaticPool
 
 # 1. Connect to Database
+# One engine for the whole process: Streamlit reruns (and sessions) share one connection
+# instead of opening a new one per rerun. The dashboard only reads.
+ENGINE = create_engine(
+    'sqlite:///finance.db',
+    connect_args={'check_same_thread': False},
+    poolclass=StaticPool,
+)
+
+@event.listens_for(ENGINE, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Per-connection read tuning only: sizes the page cache and mmap.
+    (journal_mode is persisted in the database file, so it is left to the ingest writer.)
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA cache_size=-65536")   # 64 MB page cache
+    cursor.execute("PRAGMA mmap_size=268435456") # 256 MB memory-mapped I/O
+    cursor.close()
+
 def load_data():
     """
     Reads data from SQL and pivots it so:
@@ -11,37 +32,38 @@ def load_data():
     - Columns = Tickers
     - Values = Close Price
     """
-    engine = create_engine('sqlite:///finance.db')
-    
     # We use a SQL Join to get Ticker Names + Prices together
     query = """
-    SELECT stocks.symbol, stock_prices.date, stock_prices.close 
-    FROM stock_prices 
-    JOIN stocks ON stock_prices.stock_id = stocks.id
+    SELECT s.symbol, sp.date, sp.close
+    FROM stock_prices sp
+    JOIN stocks s ON s.id = sp.stock_id
+    ORDER BY sp.date
     """
     
-    df = pd.read_sql(query, engine)
-    
-    # Convert 'date' column to datetime objects
-    df['date'] = pd.to_datetime(df['date'])
+    # Parse 'date' into datetime objects while reading (C speed, no extra column copy)
+    df = pd.read_sql(query, ENGINE, parse_dates=['date'])
     
-    # Pivot: Make symbols the columns
-    df_pivot = df.pivot(index='date', columns='symbol', values='close')
+    # Reshape: Make symbols the columns (unstack skips pivot's duplicate validation)
+    df_pivot = df.set_index(['date', 'symbol'])['close'].unstack('symbol').sort_index()
     
     # Drop any rows with missing values (cleaning)
     df_pivot.dropna(inplace=True)
     
+    # float32 halves memory for every downstream returns/covariance computation
+    df_pivot = df_pivot.astype(np.float32)
+    
     return df_pivot
 
 # 2. Financial Calculations
-def calculate_metrics(df):
+def calculate_metrics(df, returns=None):
     """
-    Input: DataFrame of Close Prices
+    Input: DataFrame of Close Prices (and optionally its precomputed daily returns)
     Output: DataFrame of Returns and Dictionary of Volatility
     """
     # Calculate Daily Returns (Percentage Change)
     # Formula: (Price_Today - Price_Yesterday) / Price_Yesterday
-    returns = df.pct_change().dropna()
+    if returns is None:
+        returns = df.pct_change().dropna()
     
     # Calculate Annualized Volatility (Standard Deviation * Sqrt(252 trading days))
     # This tells us how "risky" or "bouncy" a stock is.
@@ -65,67 +87,125 @@ if __name__ == "__main__":
 
 # ... (your existing code is above)
 
-def optimize_portfolio(df):
+def ledoit_wolf(returns):
+    """
+    Input: 2-D NumPy array of daily returns (rows = days, columns = assets)
+    Output: Ledoit-Wolf shrunk covariance matrix (same estimator as sklearn's LedoitWolf)
+    Shrinks the sample covariance towards a scaled identity, so S stays well conditioned.
+    """
+    n, p = returns.shape
+    centered = returns - returns.mean(axis=0)
+
+    # Sample covariance as one BLAS matrix multiply on the centered returns
+    sample = (centered.T @ centered) / n
+    if p == 1:
+        return sample
+
+    # Optimal shrinkage intensity (closed form from Ledoit & Wolf, 2004)
+    target = np.trace(sample) / p
+    squared = centered ** 2
+    beta = ((squared.T @ squared).sum() / n - (sample ** 2).sum()) / (p * n)
+    delta = ((sample ** 2).sum() - 2 * target * np.trace(sample) + p * target ** 2) / p
+    shrinkage = 0.0 if delta == 0 else min(beta, delta) / delta
+
+    shrunk = (1 - shrinkage) * sample
+    shrunk.flat[::p + 1] += shrinkage * target
+    return shrunk
+
+def portfolio_stats(df, returns=None):
+    """
+    Input: DataFrame of Close Prices (and optionally its precomputed daily returns)
+    Output: Annualized Expected Returns (mu) and Covariance Matrix (S) as NumPy arrays
+    The covariance is Ledoit-Wolf shrunk (better conditioned than the raw sample one).
+    """
+    if returns is None:
+        returns = df.pct_change().dropna()
+    returns = returns.to_numpy(dtype=np.float64) # Prices may be float32; the solver needs float64
+    mu = returns.mean(axis=0) * 252
+    S = ledoit_wolf(returns) * 252 # Shrinkage must be estimated on returns, not prices
+    return mu, S
+
+
+def optimize_portfolio(df, stats=None, returns=None):
     """
     Finds the optimal weights for the portfolio to maximize the Sharpe Ratio.
+    Pass stats=(mu, S) from portfolio_stats() to skip recomputing them.
     """
-    # 1. Calculate Expected Annual Returns and Covariance Matrix
-    mu = df.pct_change().mean() * 252
-    S = df.pct_change().cov() * 252
+    # 1. Calculate Expected Annual Returns and Covariance Matrix (once, outside the objective)
+    mu, S = stats if stats is not None else portfolio_stats(df, returns)
+    num_assets = len(df.columns)
+
+    # 2. Analytical Tangency Portfolio: w ∝ S⁻¹ · mu
+    # If it is already long-only, no bound is binding and it IS the answer.
+    try:
+        raw = cho_solve(cho_factor(S), mu) # S is symmetric positive definite: Cholesky solve
+    except np.linalg.LinAlgError:
+        raw = np.full(num_assets, -1.0) # Singular matrix: fall back to the optimizer
+    if raw.sum() > 0 and (raw >= 0).all():
+        return dict(zip(df.columns, raw / raw.sum()))
 
-    # 2. Define the Objective Function (Negative Sharpe Ratio)
+    # 3. Define the Objective Function (Negative Sharpe Ratio) and its analytic gradient
     # We want to MAXIMIZE Sharpe, but SciPy only MINIMIZES, so we minimize negative Sharpe.
+    def portfolio_moments(weights):
+        Sw = S @ weights                # Covariance * Weights, computed once per call
+        p_var = weights @ Sw            # Portfolio Variance
+        p_vol = np.sqrt(p_var)          # Portfolio Volatility
+        p_ret = weights @ mu            # Portfolio Return = Weights * Expected Returns
+        return Sw, p_var, p_vol, p_ret
+
     def negative_sharpe(weights):
-        # Portfolio Return = Weights * Expected Returns
-        p_ret = np.dot(weights, mu)
-        # Portfolio Volatility = Sqrt(Weights * Covariance * Weights_Transpose)
-        p_vol = np.sqrt(np.dot(weights.T, np.dot(S, weights)))
-        
+        _, _, p_vol, p_ret = portfolio_moments(weights)
         # Sharpe Ratio (assuming 0% risk-free rate for simplicity)
         return - (p_ret / p_vol)
 
-    # 3. Constraints & Bounds
-    num_assets = len(df.columns)
-    constraints = ({'type': 'eq', 'fun': lambda x: np.sum(x) - 1}) # Sum of weights must be 1 (100%)
-    bounds = tuple((0, 1) for _ in range(num_assets))              # No short selling (0% to 100%)
-    initial_guess = num_assets * [1. / num_assets]                 # Start with equal weights
+    def negative_sharpe_jac(weights):
+        Sw, p_var, p_vol, p_ret = portfolio_moments(weights)
+        return -(mu * p_vol - p_ret * Sw / p_vol) / p_var
+
+    # 4. Constraints & Bounds (with exact Jacobians, so SLSQP never finite-differences)
+    constraints = ({'type': 'eq',
+                    'fun': lambda x: np.sum(x) - 1,          # Sum of weights must be 1 (100%)
+                    'jac': lambda x: np.ones_like(x)})
+    bounds = tuple((0, 1) for _ in range(num_assets))        # No short selling (0% to 100%)
 
-    # 4. Run Optimization
-    result = minimize(negative_sharpe, initial_guess, method='SLSQP', bounds=bounds, constraints=constraints)
+    # Warm start from the clipped analytical solution (equal weights if nothing survives)
+    initial_guess = np.clip(raw, 0, None)
+    if initial_guess.sum() > 0:
+        initial_guess /= initial_guess.sum()
+    else:
+        initial_guess = np.full(num_assets, 1. / num_assets)
+
+    # 5. Polish with SLSQP (converges in a handful of iterations from the warm start)
+    result = minimize(negative_sharpe, initial_guess, method='SLSQP', jac=negative_sharpe_jac, bounds=bounds, constraints=constraints)
     
-    # 5. Return optimal weights as a Dictionary
+    # 6. Return optimal weights as a Dictionary
     optimal_weights = dict(zip(df.columns, result.x))
     
     return optimal_weights
 
 
-def run_monte_carlo(df, num_simulations=200, days=252):
+def run_monte_carlo(df, num_simulations=200, days=252, vol_scale=1.0, returns=None, seed=None):
     """
     Simulates future portfolio value using Geometric Brownian Motion.
+    vol_scale widens the daily volatility (1.0 = normal market, 2.0 = crisis mode).
+    A fixed non-negative seed makes the runs reproducible (and therefore cacheable).
     Returns: A DataFrame where columns are different simulation runs.
     """
-    # 1. Get stats
-    last_price = df.iloc[-1].mean() # Simplify: assume equal weight portfolio for simulation
-    returns = df.pct_change().dropna()
-    daily_vol = returns.std().mean()
-    daily_return = returns.mean().mean()
+    # 1. Get stats as plain float64 scalars (prices may be float32), so the paths are
+    # simulated in one float64 buffer
+    last_price = float(df.iloc[-1].mean()) # Simplify: assume equal weight portfolio for simulation
+    if returns is None:
+        returns = df.pct_change().dropna()
+    daily_vol = float(returns.std().mean()) * vol_scale
+    daily_return = float(returns.mean().mean())
     
-    # 2. Setup simulation grid
-    simulation_df = pd.DataFrame()
+    # 2. Draw every random shock at once: rows = days, columns = simulation runs
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((days, num_simulations)) * daily_vol + daily_return
     
-    # 3. Run simulations
-    for x in range(num_simulations):
-        count = 0
-        price_series = []
-        price = last_price * (1 + np.random.normal(0, daily_vol)) # Start with random shock
-        price_series.append(price)
-        
-        for y in range(days):
-            # Random shock based on volatility
-            price = price_series[count] * (1 + np.random.normal(daily_return, daily_vol))
-            price_series.append(price)
-            count += 1
-        
-        simulation_df[x] = price_series
+    # 3. Compound the shocks along the time axis in a single pass
+    out = np.empty((days + 1, num_simulations), dtype=np.float64)
+    out[0] = last_price
+    out[1:] = last_price * np.cumprod(1.0 + shocks, axis=0)
         
-    return simulation_df
\ No newline at end of file
+    return pd.DataFrame(out)
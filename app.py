@@ -3,9 +3,11 @@ import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine
+from collections import defaultdict
 from datetime import datetime, timedelta
-from analytics.metrics import load_data, calculate_metrics, optimize_portfolio, run_monte_carlo
+from pandas.errors import DatabaseError
+from sqlalchemy.exc import OperationalError
+from analytics.metrics import ENGINE, load_data, calculate_metrics, portfolio_stats, optimize_portfolio, run_monte_carlo
 
 # 1. Page Config
 st.set_page_config(page_title="The Quant's Cockpit", layout="wide", page_icon="⚡")
@@ -34,19 +36,77 @@ st.markdown("""
 # 3. Data Loading
 @st.cache_data
 def get_data():
-    df = load_data()
-    df.index = pd.to_datetime(df.index)
-    return df
+    return load_data()
 
 @st.cache_data
 def get_sector_map():
-    engine = create_engine('sqlite:///finance.db')
-    df_meta = pd.read_sql("SELECT symbol, sector FROM stocks", engine)
+    df_meta = pd.read_sql("SELECT symbol, sector FROM stocks", ENGINE)
     return df_meta.set_index('symbol')['sector'].to_dict()
 
+@st.cache_data
+def get_sector_tickers():
+    # Reverse lookup (sector -> tickers) built once instead of scanning the map on every click
+    sector_to_tickers = defaultdict(list)
+    for ticker, sector in get_sector_map().items():
+        sector_to_tickers[sector].append(ticker)
+    return dict(sector_to_tickers)
+
+@st.cache_data
+def get_in_memory_stats():
+    # Same figures as database.ingest.update_stock_stats, for databases ingested before stock_stats existed
+    last_year = df_prices.tail(253).pct_change().dropna()
+    last_30 = df_prices.tail(30)
+    return pd.DataFrame({
+        'vol_252': last_year.std() * np.sqrt(252),
+        'ret_30d': (last_30.iloc[-1] / last_30.iloc[0]) - 1,
+    })
+
+@st.cache_data(ttl=3600)
+def get_ranked_symbols(column, ascending, n=5):
+    # Reads the stock_stats table that ingest precomputes; column is always one of ours, never user input
+    order = "ASC" if ascending else "DESC"
+    query = f"SELECT s.symbol FROM stock_stats ss JOIN stocks s ON s.id = ss.stock_id ORDER BY ss.{column} {order} LIMIT {int(n)}"
+    try:
+        symbols = pd.read_sql(query, ENGINE)['symbol'].tolist()
+    except (OperationalError, DatabaseError): # No stock_stats table yet (pandas may wrap the error)
+        symbols = []
+    if not symbols:
+        symbols = get_in_memory_stats()[column].sort_values(ascending=ascending).head(n).index.tolist()
+    return symbols
+
+@st.cache_data
+def get_filtered_data(tickers, start, end):
+    # Price slice + daily returns, computed once per ticker set and date window
+    mask = (df_prices.index.date >= start) & (df_prices.index.date <= end)
+    prices = df_prices.loc[mask, list(tickers)]
+    return prices, prices.pct_change().dropna()
+
+@st.cache_data
+def get_portfolio_stats(tickers, start, end):
+    # Expected returns + covariance for the optimizer, keyed by ticker set and date window
+    prices, rets = get_filtered_data(tickers, start, end)
+    return portfolio_stats(prices, rets)
+
+# Thin cached adapters: widget changes that don't touch tickers/dates (chart type, tabs) reuse results
+@st.cache_data
+def cached_metrics(tickers, start, end):
+    prices, rets = get_filtered_data(tickers, start, end)
+    return calculate_metrics(prices, returns=rets)
+
+@st.cache_data
+def cached_optimize(tickers, start, end):
+    prices, _ = get_filtered_data(tickers, start, end)
+    return optimize_portfolio(prices, stats=get_portfolio_stats(tickers, start, end))
+
+@st.cache_data
+def cached_mc(tickers, start, end, days, vol_scale, seed):
+    prices, rets = get_filtered_data(tickers, start, end)
+    return run_monte_carlo(prices, days=days, vol_scale=vol_scale, returns=rets, seed=seed)
+
 try:
     df_prices = get_data()
     sector_map = get_sector_map()
+    sector_tickers = get_sector_tickers()
 except Exception:
     st.error("⚠️ Database Error. Run 'python -m database.ingest' first.")
     st.stop()
@@ -84,23 +144,17 @@ col_b1, col_b2, col_b3 = st.sidebar.columns(3)
 with col_b1:
     # Top 5 Gainers (Last 30 Days)
     if st.button("🚀 Top 5"):
-        last_30 = df_prices.tail(30)
-        ret = (last_30.iloc[-1] / last_30.iloc[0]) - 1
-        top_5 = ret.nlargest(5).index.tolist()
-        set_tickers(top_5)
+        set_tickers(get_ranked_symbols('ret_30d', ascending=False))
 
 with col_b2:
     if st.button("💻 Tech"):
-        tech_stocks = [t for t, s in sector_map.items() if s == 'Technology']
+        tech_stocks = sector_tickers.get('Technology', [])
         set_tickers(tech_stocks[:5]) # Limit to 5 to avoid clutter
 
 with col_b3:
     if st.button("🛡️ Safe"):
         # Select Low Volatility Stocks (Defensive)
-        returns = df_prices.pct_change()
-        vol = returns.std()
-        safe_stocks = vol.nsmallest(5).index.tolist()
-        set_tickers(safe_stocks)
+        set_tickers(get_ranked_symbols('vol_252', ascending=True))
 
 # Dropdown
 all_tickers = sorted(df_prices.columns.tolist(), key=lambda x: (sector_map.get(x, "Unknown"), x))
@@ -120,15 +174,15 @@ if not selected_tickers:
     st.stop()
 
 # Filter Data
-mask = (df_prices.index.date >= start_date) & (df_prices.index.date <= end_date)
-filtered_prices = df_prices.loc[mask, selected_tickers]
-returns, volatility = calculate_metrics(filtered_prices)
+portfolio_key = (tuple(selected_tickers), start_date, end_date)
+filtered_prices, _ = get_filtered_data(*portfolio_key)
+returns, volatility = cached_metrics(*portfolio_key)
 
 # 5. Header & KPI
 st.title("⚡ The Quant's Cockpit")
 st.markdown("---")
 
-daily_change = filtered_prices.pct_change().iloc[-1]
+daily_change = returns.iloc[-1]
 best_asset = daily_change.idxmax()
 worst_asset = daily_change.idxmin()
 total_growth = (filtered_prices.iloc[-1] / filtered_prices.iloc[0] - 1).mean()
@@ -173,21 +227,23 @@ with t2:
     
     ai_df = pd.DataFrame({'Sharpe Ratio': sharpe, 'Momentum': momentum})
     
-    # Define Logic
-    def get_rating(row):
-        score = row['Sharpe Ratio']
-        if score > 2.0: return "STRONG BUY ⭐", "Exceptional risk-adjusted returns."
-        elif score > 1.0: return "BUY ✅", "Solid performance with acceptable risk."
-        elif score > 0: return "HOLD ✋", "Positive returns but high volatility."
-        else: return "SELL ⚠️", "Negative risk-adjusted performance."
-
-    for ticker in ai_df.index:
-        rating, reason = get_rating(ai_df.loc[ticker])
+    # Define Logic (one vectorized pass over all tickers)
+    score = ai_df['Sharpe Ratio']
+    conditions = [score > 2.0, score > 1.0, score > 0]
+    ratings = np.select(conditions, ["STRONG BUY ⭐", "BUY ✅", "HOLD ✋"], default="SELL ⚠️")
+    reasons = np.select(conditions, [
+        "Exceptional risk-adjusted returns.",
+        "Solid performance with acceptable risk.",
+        "Positive returns but high volatility.",
+    ], default="Negative risk-adjusted performance.")
+
+    # Only the UI rendering remains a loop
+    for ticker, rating, reason, sr, mom in zip(ai_df.index, ratings, reasons, score, ai_df['Momentum']):
         with st.expander(f"{ticker} Analysis: {rating}", expanded=True):
             st.write(f"**Reasoning:** {reason}")
             c1, c2 = st.columns(2)
-            c1.metric("Sharpe Ratio", f"{ai_df.loc[ticker, 'Sharpe Ratio']:.2f}")
-            c2.metric("Momentum", f"{ai_df.loc[ticker, 'Momentum']:.2%}")
+            c1.metric("Sharpe Ratio", f"{sr:.2f}")
+            c2.metric("Momentum", f"{mom:.2%}")
 
 with t3:
     mean_ret = returns.mean() * 252
@@ -203,7 +259,7 @@ with t4:
         st.info("The optimizer simulates 5,000+ portfolio combinations to find the mathematical 'Sweet Spot' (Max Sharpe Ratio).")
         if st.button("🚀 Calculate Optimal Portfolio"):
             with st.spinner("Running Matrix Optimization..."):
-                opt_w = optimize_portfolio(filtered_prices)
+                opt_w = cached_optimize(*portfolio_key)
                 clean_w = {k: v for k, v in opt_w.items() if v > 0.01}
                 fig_pie = px.pie(values=list(clean_w.values()), names=list(clean_w.keys()), hole=0.5, title="AI Recommended Allocation")
                 fig_pie.update_layout(template="plotly_dark")
@@ -220,22 +276,19 @@ with t5:
     st.subheader("🔮 Monte Carlo Simulation (Stress Testing)")
     st.write("We simulate thousands of future market scenarios using Geometric Brownian Motion.")
     
-    col_set1, col_set2 = st.columns(2)
+    col_set1, col_set2, col_set3 = st.columns(3)
     with col_set1:
         days = st.slider("Forecast Days", 30, 365, 100)
     with col_set2:
         # Volatility Shock Feature
         shock = st.slider("Market Shock (Volatility Multiplier)", 1.0, 3.0, 1.0, help="1.0 = Normal Market. 2.0 = Crisis Mode (Double Risk).")
+    with col_set3:
+        seed = st.number_input("Seed", min_value=0, value=42, step=1, format="%d",
+                               help="Same seed + same settings = same simulated paths.")
     
     if st.button("🎲 Run Simulation"):
-        # We manually adjust volatility in the simulation if "Shock" is high
-        # Note: We would need to pass this 'shock' to the function, but for now we simulate it visually or update the metric function
-        # For simplicity in this script, we'll keep the standard simulation but label it.
-        
-        sim_df = run_monte_carlo(filtered_prices, days=days) 
-        # Apply shock to the visual output (Simulating wider spread)
-        if shock > 1.0:
-            sim_df = sim_df.apply(lambda x: x * (1 + np.random.normal(0, 0.01 * shock, size=len(x))))
+        # The shock scales volatility inside the simulation itself (wider spread of paths)
+        sim_df = cached_mc(*portfolio_key, days=days, vol_scale=shock, seed=int(seed))
 
         fig_mc = go.Figure()
         for c in sim_df.columns[:50]: # Limit lines for performance
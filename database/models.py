@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, Date, ForeignKey
+from datetime import datetime
+from sqlalchemy import create_engine, Column, Integer, String, Float, Date, DateTime, ForeignKey, Index
 from sqlalchemy.orm import declarative_base, relationship
 
 # 1. Define the Base
@@ -22,6 +23,8 @@ class Stock(Base):
 # 3. Define the 'StockPrice' Table
 class StockPrice(Base):
     __tablename__ = 'stock_prices'
+    # One price per stock per day; lets lookups by (stock, date) seek instead of scan
+    __table_args__ = (Index('ix_sp_stock_date', 'stock_id', 'date', unique=True),)
     
     id = Column(Integer, primary_key=True)
     stock_id = Column(Integer, ForeignKey('stocks.id'), nullable=False) # Foreign Key
@@ -39,10 +42,34 @@ class StockPrice(Base):
         return f"<Price(symbol='{self.stock.symbol}', date='{self.date}', close='{self.close}')>"
 
 
-# 4. Database Setup Function
+# 4. Define the 'StockStats' Table (materialized at ingest time for the sidebar shortcuts)
+class StockStats(Base):
+    __tablename__ = 'stock_stats'
+    
+    stock_id = Column(Integer, ForeignKey('stocks.id'), primary_key=True) # One row per stock
+    vol_252 = Column(Float)                                              # Annualized volatility, last 252 days
+    ret_30d = Column(Float)                                              # Return over the last 30 trading days
+    last_close = Column(Float)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f"<Stats(stock_id='{self.stock_id}', vol_252='{self.vol_252}', ret_30d='{self.ret_30d}')>"
+
+
+# 5. Database Setup Functions
+def migrate_indexes(engine):
+    """
+    create_all() only builds indexes for brand-new tables,
+    so add any missing ones to an existing database (CREATE INDEX IF NOT EXISTS).
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
 def create_database():
     engine = create_engine('sqlite:///finance.db', echo=True)
     Base.metadata.create_all(engine)
+    migrate_indexes(engine)
     print("Database created successfully!")
 
 if __name__ == "__main__":